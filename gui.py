@@ -1,10 +1,20 @@
+import ast
+import collections
+import logging
+from typing import Optional, Tuple
+
 from gui_elements import *
 from trackable import *
 import tkinter as tk
 
+logger = logging.getLogger(__name__)
+
 
 class ObserverApp(tk.Frame):
     """A tkinter frame that represents the state of a trackable object"""
+    DRAIN_INTERVAL = 16  # milliseconds between applying queued updates
+    MAX_DRAIN = 100  # maximum number of queued updates applied per drain
+    WRITE_INTERVAL = 33  # milliseconds to collect attribute changes for before writing them to the widgets
 
     def __init__(self, observer: Observer, master=None):
         super().__init__()
@@ -13,11 +23,21 @@ class ObserverApp(tk.Frame):
         self.options = None
         self.observer = observer
         observer.notify_callback = self.update_widgets
-        self.pages: Dict[str, TrackableFrame] = dict()
+        self.pages: Dict[str, Optional[TrackableFrame]] = dict()  # pages are built when they are first shown
+        # appends and poplefts are atomic, so notifying threads and the tkinter thread can share it without a lock
+        self._pending = collections.deque()
+        self._attr_cache: Dict[str, Dict[str, object]] = dict()
+        self._pending_writes: Dict[Tuple[str, str], object] = dict()
+        self._flush_token = None
+        # handlers for each event type, indexed by the event type
+        self._update_handlers = [self._ignore_update] * EVENT_TYPES.COUNT
+        self._update_handlers[EVENT_TYPES.SET_ATTRIBUTE] = self._apply_set_attribute
+        self._update_handlers[EVENT_TYPES.BATCH_SET] = self._apply_batch_set
+        self._update_handlers[EVENT_TYPES.TRACKABLE_ADDED] = self._apply_trackable_added
+        self.create_options()
         self.initialize_elements()
 
-
-        self.update_options()
+        self.after(self.DRAIN_INTERVAL, self._drain)
 
     def __repr__(self):
         return f"ObserverApp(Trackables: {self.pages.values()})"
@@ -25,37 +45,105 @@ class ObserverApp(tk.Frame):
     def add_trackable(self, trackable_name):
         """Adds a trackable page to the app"""
         if trackable_name not in self.pages:
-            self.pages[trackable_name] = TrackableFrame(trackable_name, self.observer, self)
-        self.update_options()
+            self.pages[trackable_name] = None
+            self.add_option(trackable_name)
 
-    def update_options(self):
-        """Updates the options menu to match the trackable objects in the app"""
-        self.options = tk.OptionMenu(self, self.choice, *self.pages.keys(), command=self.change_page)
+    def create_options(self):
+        """Creates an empty options menu, trackables are added to it as they are added to the app"""
+        self.options = tk.OptionMenu(self, self.choice, "", command=self.change_page)
+        self.options["menu"].delete(0, tk.END)
         self.options.grid(row=0, column=0)
 
+    def add_option(self, trackable_name):
+        """Adds a trackable to the existing options menu, rather than recreating the menu"""
+        self.options["menu"].add_command(label=trackable_name,
+                                         command=tk._setit(self.choice, trackable_name, self.change_page))
+
     def initialize_elements(self):
         """If trackables are added before the app is initialized, this will add them to the app"""
-        for trackable_name in self.observer.get_trackable_attributes():
+        self._attr_cache = self.observer.get_trackable_attributes()
+        for trackable_name in self._attr_cache:
             self.add_trackable(trackable_name)
 
     def update_widgets(self, trackable_name, key, value, event_type):
-        """automatically called when a trackable attribute is changed"""
-        if event_type == EVENT_TYPES.SET_ATTRIBUTE:
-            self.pages[trackable_name].update_value(key, value)
-        elif event_type == EVENT_TYPES.TRACKABLE_ADDED:
-            # todo pass attributes into children, see if its faster than getting them within each child
-            print(f"Adding {trackable_name} to {self.pages.keys()}")
-            self.add_trackable(trackable_name)
+        """automatically called when a trackable attribute is changed, possibly from another thread.
+        Tkinter is not thread safe, so the update is only queued here and applied on the tkinter thread by _drain"""
+        self._pending.append((trackable_name, key, value, event_type))
+
+    def _drain(self):
+        """Applies queued updates to the widgets, then schedules the next drain"""
+        self.observer.mediator.drain()
+        pending = self._pending
+        for _ in range(self.MAX_DRAIN):
+            try:
+                update = pending.popleft()
+            except IndexError:
+                break
+            self.apply_update(*update)
+        self.after(self.DRAIN_INTERVAL, self._drain)
+
+    def apply_update(self, trackable_name, key, value, event_type):
+        """Applies a single update to the widgets, must be called from the tkinter thread"""
+        self._update_handlers[event_type](trackable_name, key, value)
+
+    def _apply_set_attribute(self, trackable_name, key, value):
+        self._attr_cache.setdefault(trackable_name, dict())[key] = value
+
+        # hidden pages are refreshed when they are shown, in change_page
+        if self.last_choice != trackable_name:
+            return
+
+        # bursts of changes to the same attribute are collapsed into a single widget write
+        self._pending_writes[(trackable_name, key)] = value
+        if self._flush_token is None:
+            self._flush_token = self.after(self.WRITE_INTERVAL, self._flush_writes)
+
+    def _apply_batch_set(self, trackable_name, key, value):
+        for attribute_name, attribute_value in value.items():
+            self._apply_set_attribute(trackable_name, attribute_name, attribute_value)
+
+    def _apply_trackable_added(self, trackable_name, key, value):
+        logger.debug("Adding %s to %s", trackable_name, self.pages.keys())
+        self._attr_cache[trackable_name] = dict(value[0])
+        self.add_trackable(trackable_name)
+
+    def _ignore_update(self, trackable_name, key, value):
+        pass
+
+    def _flush_writes(self):
+        """Writes the latest value of each changed attribute to the widgets of the visible page"""
+        self._flush_token = None
+        pending_writes, self._pending_writes = self._pending_writes, dict()
+        for (trackable_name, key), value in pending_writes.items():
+            if trackable_name == self.last_choice:
+                self.pages[trackable_name].update_value(key, value)
 
     def change_page(self, trackable_name):
         """Changes the page to the one specified by trackable_name"""
-        print(f"last choice: {self.last_choice}, current choice: {trackable_name}")
+        logger.debug("last choice: %s, current choice: %s", self.last_choice, trackable_name)
         if self.last_choice:
             self.pages[self.last_choice].grid_forget()
+
+        # the cache misses silent writes and changes to attributes that aren't notified, so pages are built and
+        # refreshed from the trackable itself
+        attributes = self.observer.get_trackable_attributes(trackable_name)
+        self._attr_cache[trackable_name] = attributes
+        if self.pages[trackable_name] is None:
+            self.pages[trackable_name] = TrackableFrame(trackable_name, self.observer, self, attributes)
+        else:
+            self.pages[trackable_name].refresh(attributes)
         self.pages[trackable_name].grid(row=1, column=0)
         self.last_choice = trackable_name
 
 
+def parse_value(text):
+    """Parses a python literal typed by the user, falling back to the text itself"""
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return text
+
+
 #@track_vars("test_var", "timer", "timer2", "test_2")
 def main():
     #start_logging()
@@ -64,7 +152,7 @@ def main():
     # main_tab = ttk.Frame(notebook)
 
     t = Trackable(None, "test")
-    m = Mediator()
+    m = Mediator(using_queue=True)
     m.add_trackable(t)
     # m.add_trackable(global_tracker)
     t.x = 0
@@ -74,9 +162,30 @@ def main():
     o = Observer(m)
     print(o.get_trackable_attributes())
     thread1_observer = Observer(m)
-    thread2_observer = Observer(m)
+    timer_observer = Observer(m)
     app = ObserverApp(o, master=root)
 
+    timer_keys: Dict[str, Tuple[str, ...]] = dict()  # names of the timer attributes of each trackable
+
+    def add_timer_keys(trackable_name, keys):
+        known_keys = timer_keys.get(trackable_name, ())
+        new_keys = tuple(key for key in keys if "timer" in key and key not in known_keys)
+        if new_keys:
+            timer_keys[trackable_name] = known_keys + new_keys
+
+    def update_timer_keys(trackable_name, key, value, event_type):
+        """Keeps timer_keys up to date, so increment_timers doesn't have to search every attribute on every tick"""
+        if event_type == EVENT_TYPES.SET_ATTRIBUTE:
+            add_timer_keys(trackable_name, (key,))
+        elif event_type == EVENT_TYPES.BATCH_SET:
+            add_timer_keys(trackable_name, value)
+        elif event_type == EVENT_TYPES.TRACKABLE_ADDED:
+            add_timer_keys(trackable_name, value[0])
+
+    timer_observer.set_notify_callback(update_timer_keys)
+    for trackable_name, attributes in timer_observer.get_trackable_attributes().items():
+        add_timer_keys(trackable_name, attributes)
+
     def input_thread():
         user_input = ""
         while user_input != "quit":
@@ -86,20 +195,28 @@ def main():
                     m.add_trackable(Trackable("test"))
                 else:
                     name, key, value = user_input.split(" ")
-                    thread1_observer.set_trackable_attribute(name, key, eval(value))
+                    thread1_observer.set_trackable_attribute(name, key, parse_value(value))
             except Exception as e:
                 print(e)
 
             print(thread1_observer.get_trackable_attributes())
 
-    def increment_thread():
-        while True:
-            trackables = thread2_observer.get_trackable_attributes()
-            for trackable, attributes in trackables.items():
-                for key, value in attributes.items():
-                    if "timer" in key and value is not None:
-                        thread2_observer.set_trackable_attribute(trackable, key, value + 1)
-            time.sleep(0.05)
+    def increment_timers():
+        """Increments every timer attribute, run from the tkinter event loop so it never touches widgets from
+        another thread"""
+        for trackable, keys in list(timer_keys.items()):
+            # only the timer attributes are read, rather than copying every attribute of every trackable
+            updates = dict()
+            for key in keys:
+                try:
+                    value = timer_observer.get_trackable_attribute(trackable, key)
+                except KeyError:
+                    continue  # the trackable or attribute has been removed
+                if value is not None:
+                    updates[key] = value + 1
+            if updates:
+                timer_observer.set_trackable_attributes(trackable, updates)
+        root.after(50, increment_timers)
 
     thread = threading.Thread(target=input_thread)
     thread.start()
@@ -109,15 +226,13 @@ def main():
     # timer2 = 0
     # timer = 0
 
-    thread2 = threading.Thread(target=increment_thread)
-    thread2.start()
+    root.after(50, increment_timers)
 
     app.pack()
     # notebook.pack()
     root.mainloop()
 
     thread.join()
-    thread2.join()
 
 
 if __name__ == "__main__":
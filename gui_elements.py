@@ -1,38 +1,67 @@
+import ast
+import logging
 import tkinter as tk
 from tkinter import ttk
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 
 from trackable import Observer
 
+logger = logging.getLogger(__name__)
+
+_MISSING = object()  # sentinel for attribute values that have not been fetched yet
+_NUMERIC_TYPES = (int, float)  # share the widgets of GuiElementInt, so an element of one can show the other
+
 
 class GuiElement(ttk.Frame):
     """A frame, allowing interaction with an attribute of a trackable object, with different functionality depending
      on the type of attribute"""
+    WRITE_DELAY = 50  # milliseconds to wait for the user to pause before writing to the trackable
 
-    def __init__(self, trackable_name, attribute_name, observer: Observer, vartype=tk.Variable, master=None):
+    def __init__(self, trackable_name, attribute_name, observer: Observer, vartype=tk.Variable, master=None,
+                 value=_MISSING):
         super().__init__(master)
         self.observer = observer
         self.trackable_name = trackable_name
         self.attribute_name = attribute_name
+        # bound once, so a write from the widget goes straight to the mediator
+        self._set_attribute = observer.mediator.set_attribute
 
+        # the value last written to or received from the trackable
+        if value is _MISSING:
+            value = self.observer.get_trackable_attribute(self.trackable_name, self.attribute_name)
+        self._cached_value = value
         self.widget_value = vartype()
-        self.widget_value.set(self.attribute_value)
+        self.widget_value.set(self._cached_value)
         self.widget_value.trace_add("write", self.write_callback)
         self.trace_enabled = True
+        self.interacting = False
+        self._write_token = None
 
-        self.type = type(self.attribute_value)
+        self.type = type(self._cached_value)
         self.widgets = self.create_widgets()
         for widget in self.widgets:
             widget.pack()
+            widget.bind("<ButtonPress-1>", self.start_interaction, add="+")
+            widget.bind("<ButtonRelease-1>", self.end_interaction, add="+")
 
     @property
     def attribute_value(self):
-        value = self.observer.get_trackable_attribute(self.trackable_name, self.attribute_name)
-        return value
+        return self._cached_value
 
     @attribute_value.setter
     def attribute_value(self, value):
-        self.observer.set_trackable_attribute(self.trackable_name, self.attribute_name, value, silent=True)
+        self._write_attribute_value(value)
+
+    def _write_attribute_value(self, value):
+        """Writes value to the trackable, unless it is the value last written to or received from it"""
+        if self.is_cached(value):
+            return
+        self._cached_value = value
+        self._set_attribute(self.trackable_name, self.attribute_name, value, silent=True)
+
+    def is_cached(self, value):
+        """Whether value is the same as the value last written to or received from the trackable"""
+        return type(value) is type(self._cached_value) and value == self._cached_value
 
     def disable_trace(self):
         if not self.trace_enabled:
@@ -46,6 +75,22 @@ class GuiElement(ttk.Frame):
         self.trace_enabled = True
         # self.widget_value.trace_add("write", self.write_callback)
 
+    def destroy(self):
+        # a pending write would otherwise keep the element alive and fire on its destroyed widgets
+        if self._write_token is not None:
+            self.after_cancel(self._write_token)
+            self._write_token = None
+        super().destroy()
+
+    def start_interaction(self, event=None):
+        """Called when the user starts dragging or clicking a widget, updates from the trackable are ignored until
+        the interaction ends"""
+        self.interacting = True
+
+    def end_interaction(self, event=None):
+        self.interacting = False
+        self.flush_write()
+
     def create_widgets(self):
         for widget in self.winfo_children():
             widget.destroy()
@@ -55,6 +100,7 @@ class GuiElement(ttk.Frame):
         return widgets
 
     def update_widget_value(self, new_value):
+        self._cached_value = new_value
         self.disable_trace()
         self.widget_value.set(new_value)
         self.enable_trace()
@@ -62,10 +108,22 @@ class GuiElement(ttk.Frame):
     def write_callback(self, *args):
         if not self.trace_enabled:
             return
+        # each keystroke or slider movement restarts the delay, so only the value the user settles on is written
+        if self._write_token is not None:
+            self.after_cancel(self._write_token)
+        self._write_token = self.after(self.WRITE_DELAY, self.flush_write)
+
+    def flush_write(self):
+        """Writes a pending change of the widget's value to the trackable"""
+        if self._write_token is None:
+            return
+        self.after_cancel(self._write_token)
+        self._write_token = None
         self.update_attribute_value(self.widget_value.get())
 
     def update_attribute_value(self, new_value):
-        self.attribute_value = new_value
+        # skips the attribute_value property, as this is called for every write from the widget
+        self._write_attribute_value(new_value)
 
     def button_callback(self):
         pass
@@ -81,13 +139,14 @@ class GuiElementBool(GuiElement):
 class GuiElementStr(GuiElement):
     def create_widgets(self):
         widgets = super().create_widgets()
-        widgets.append(tk.Entry(self, textvariable=self.attribute_value))
+        widgets.append(tk.Entry(self, textvariable=self.widget_value))
         return widgets
 
 
 class GuiElementInt(GuiElement):
-    def __init__(self, trackable_name, attribute_name, observer: Observer, master=None):
-        super().__init__(trackable_name, attribute_name, observer, tk.DoubleVar, master)
+    def __init__(self, trackable_name, attribute_name, observer: Observer, vartype=tk.DoubleVar, master=None,
+                 value=_MISSING):
+        super().__init__(trackable_name, attribute_name, observer, vartype, master, value)
         self.min, self.max = 0, 360
         self.sign = 1
 
@@ -103,6 +162,7 @@ class GuiElementInt(GuiElement):
         self.widgets[2].config(from_=min, to=max)
 
     def update_widget_value(self, new_value):
+        self._cached_value = new_value
         self.disable_trace()
         self.widget_value.set(abs(round(new_value, 2)))
         self.set_range(0, max(new_value, self.max))
@@ -113,7 +173,7 @@ class GuiElementInt(GuiElement):
         self.update_attribute_value(self.widget_value.get())
 
     def update_attribute_value(self, new_value):
-        self.attribute_value = new_value * self.sign
+        super().update_attribute_value(new_value * self.sign)
 
 
 class GuiElementFloat(GuiElementInt):
@@ -171,86 +231,216 @@ class GuiElementNone(GuiElement):
 
 class GuiElementFactory:
     """A factory for creating GuiElements of different types"""
-    custom_types = dict()
+
+    # maps attribute types to their gui element and tkinter variable type, custom types are added by add_type
+    _dispatch = {
+        bool: (GuiElementBool, tk.BooleanVar),
+        str: (GuiElementStr, tk.StringVar),
+        int: (GuiElementInt, tk.DoubleVar),
+        float: (GuiElementFloat, tk.DoubleVar),
+        type(None): (GuiElementNone, tk.Variable),
+    }
+
+    @staticmethod
+    def create(trackable_name, attribute_name, observer: Observer, master=None, attribute_value=_MISSING):
+        """Creates the gui element for an attribute, attribute_value can be passed if the caller already has it"""
+        if attribute_value is _MISSING:
+            attribute_type = observer.get_trackable_attribute_type(trackable_name, attribute_name)
+        else:
+            attribute_type = type(attribute_value)
+
+        dispatch = GuiElementFactory._dispatch.get(attribute_type)
+        if dispatch is None:
+            raise TypeError(f"Type {attribute_type} not supported")
+        gui_element, vartype = dispatch
+        return gui_element(trackable_name, attribute_name, observer, vartype, master, attribute_value)
 
     @staticmethod
-    def create(trackable_name, attribute_name, observer: Observer, master=None):
-        attribute_value = observer.get_trackable_attributes(trackable_name)[attribute_name]
-        attribute_type = type(attribute_value)
-        if attribute_type == bool:
-            return GuiElementBool(trackable_name, attribute_name, observer, tk.BooleanVar, master)
-        elif attribute_type == str:
-            return GuiElementStr(trackable_name, attribute_name, observer, tk.StringVar, master)
-        elif attribute_type == int:
-            return GuiElementInt(trackable_name, attribute_name, observer, master)
-        elif attribute_type == float:
-            return GuiElementFloat(trackable_name, attribute_name, observer, master)
-        # elif attribute_type == list:
-        #     return GuiElementList(trackable_name, attribute_name, observer, master=master)
-        # elif attribute_type == dict:
-        #     return GuiElementDict(trackable_name, attribute_name, observer, master=master)
-        # elif attribute_type == callable:
-        #     return GuiElementCallable(trackable_name, attribute_name, observer, master=master)
-        elif attribute_type == type(None):
-            return GuiElementNone(trackable_name, attribute_name, observer, master=master)
-
-        for custom_type in GuiElementFactory.custom_types:
-            if attribute_type == custom_type:
-                return GuiElementFactory.custom_types[type](trackable_name, attribute_name, observer, master)
-
-        raise TypeError(f"Type {attribute_type} not supported")
+    def supports(type_):
+        """Whether create can make an element for attributes of type_"""
+        return type_ in GuiElementFactory._dispatch
 
     @staticmethod
-    def add_type(type_, gui_element):
-        GuiElementFactory.custom_types[type_] = gui_element
+    def add_type(type_, gui_element, vartype=tk.Variable):
+        GuiElementFactory._dispatch[type_] = (gui_element, vartype)
 
 
 class TrackableFrame(ttk.Frame):
     """A frame containing all the gui elements for a trackable object"""
+    TEXT_ROW_HEIGHT = 20
 
-    def __init__(self, trackable_name, observer: Observer, master=None):
+    def __init__(self, trackable_name, observer: Observer, master=None, attributes=None):
         super().__init__(master)
         self.observer = observer
         self.trackable_name = trackable_name
         self.gui_elements: Dict[str, GuiElement] = dict()
         self.columns = 2
 
-        self.create_widgets()
+        # attributes without an editable gui element are drawn as text items on a single canvas
+        self.canvas = None
+        self.text_rows: Dict[str, int] = dict()
+        self._row_editor: Optional[Tuple[str, tk.Entry]] = None  # the attribute of the text row being edited
+
+        self.create_widgets(attributes)
 
     @property
     def n_elements(self):
         return len(self.gui_elements)
 
-    def create_widgets(self):
-        for widget in self.winfo_children():
-            widget.destroy()
-
-        self.gui_elements.clear()
-        for attribute_name in self.observer.get_trackable_attributes(self.trackable_name):
-            self.add_element(attribute_name)
+    def create_widgets(self, attributes=None):
+        """Creates elements for new attributes and removes those of attributes that no longer exist, existing
+        elements are kept"""
+        if attributes is None:
+            attributes = self.observer.get_trackable_attributes(self.trackable_name)
+
+        removed_elements = self.gui_elements.keys() - attributes.keys()
+        for attribute_name in removed_elements:
+            self.remove_element(attribute_name)
+        for attribute_name in self.text_rows.keys() - attributes.keys():
+            self.remove_text_row(attribute_name)
+
+        n_elements = self.n_elements
+        for attribute_name, value in attributes.items():
+            if attribute_name not in self.gui_elements and attribute_name not in self.text_rows:
+                self.add_element(attribute_name, value, place=False)
+
+        # every element is placed in a single pass once they have all been created, which also closes the gaps left
+        # by removed elements
+        if removed_elements or self.n_elements != n_elements:
+            self.grid_elements()
+
+    def grid_elements(self):
+        """Places every element in order, filling the grid row by row"""
+        for index, gui_element in enumerate(self.gui_elements.values()):
+            row, column = divmod(index, self.columns)
+            gui_element.grid(row=row, column=column)
+
+    def add_element(self, attribute_name, value=_MISSING, place=True):
+        logger.debug("Adding %s, to %s, elements: %s", attribute_name, self.trackable_name, self.gui_elements)
+        if value is _MISSING:
+            value = self.observer.get_trackable_attribute(self.trackable_name, attribute_name)
+        if not GuiElementFactory.supports(type(value)):
+            if attribute_name in self.gui_elements:
+                self.remove_element(attribute_name)
+            self.add_text_row(attribute_name, value)
+            return
+        gui_element = GuiElementFactory.create(self.trackable_name, attribute_name, self.observer, self, value)
+        old_element = self.gui_elements.get(attribute_name)
+        if old_element is not None:
+            old_element.destroy()  # replaced elements would otherwise stay alive as children of the frame
 
-    def add_element(self, attribute_name):
-        print(f"Adding {attribute_name}, to {self.trackable_name}, elements: {self.gui_elements}")
-        gui_element = GuiElementFactory.create(self.trackable_name, attribute_name, self.observer, self)
-        gui_element.grid(row=self.n_elements // self.columns, column=self.n_elements % self.columns)
+        if place:
+            row, column = divmod(self.n_elements, self.columns)
+            gui_element.grid(row=row, column=column)
 
         self.gui_elements[attribute_name] = gui_element
-        print(f"Added {attribute_name}, to {self.trackable_name}, elements: {self.gui_elements}")
+        logger.debug("Added %s, to %s, elements: %s", attribute_name, self.trackable_name, self.gui_elements)
+
+    def replace_element(self, attribute_name, value):
+        """Replaces the element of an attribute with one matching the type of value, in the same grid cell"""
+        grid_info = self.gui_elements[attribute_name].grid_info()
+        self.add_element(attribute_name, value, place=False)
+        if attribute_name in self.gui_elements:
+            self.gui_elements[attribute_name].grid(row=grid_info["row"], column=grid_info["column"])
+        else:
+            self.grid_elements()  # the attribute became a text row, so the elements after it move up to fill its cell
 
     def remove_element(self, attribute_name):
-        print(f"Removing {attribute_name}, from {self.trackable_name}, elements: {self.gui_elements}")
+        logger.debug("Removing %s, from %s, elements: %s", attribute_name, self.trackable_name, self.gui_elements)
         gui_element = self.gui_elements[attribute_name]
         gui_element.destroy()
         del self.gui_elements[attribute_name]
-        print(f"Removed {attribute_name}, from {self.trackable_name}, elements: {self.gui_elements}")
+        logger.debug("Removed %s, from %s, elements: %s", attribute_name, self.trackable_name, self.gui_elements)
 
-    def update_value(self, attribute_name, new_value):
-        if attribute_name in self.gui_elements:
-            if isinstance(self.gui_elements[attribute_name], GuiElementNone):
-                self.remove_element(attribute_name)
-                self.add_element(attribute_name)  # if the attribute was previously None, overwrite it
-                self.create_widgets()
+    def add_text_row(self, attribute_name, value):
+        """Displays a read-only attribute as a line of text, which is far cheaper than a frame of widgets"""
+        if attribute_name in self.text_rows:
+            self.canvas.itemconfigure(self.text_rows[attribute_name], text=f"{attribute_name} = {value}")
+            return
+        if self.canvas is None:
+            self.canvas = tk.Canvas(self, height=0, highlightthickness=0)
+            self.canvas.grid(row=0, column=self.columns, sticky="n")
+
+        # rows are kept packed from the top, so the next free position is below the last one
+        y = len(self.text_rows) * self.TEXT_ROW_HEIGHT
+        item = self.canvas.create_text(0, y, anchor="nw", text=f"{attribute_name} = {value}")
+        self.canvas.tag_bind(item, "<Button-1>", lambda event: self.edit_text_row(attribute_name))
+        self.text_rows[attribute_name] = item
+        self.canvas.configure(height=y + self.TEXT_ROW_HEIGHT)
+
+    def remove_text_row(self, attribute_name):
+        """Removes the text row of an attribute, moving the rows below it up to fill the gap"""
+        self.close_row_editor()
+        self.canvas.delete(self.text_rows.pop(attribute_name))
+        for index, item in enumerate(self.text_rows.values()):
+            self.canvas.coords(item, 0, index * self.TEXT_ROW_HEIGHT)
+        self.canvas.configure(height=len(self.text_rows) * self.TEXT_ROW_HEIGHT)
+
+    def edit_text_row(self, attribute_name):
+        """Covers a clicked text row with an entry holding the attribute's value as a python literal. Return writes
+        the entry to the trackable, escape cancels"""
+        self.close_row_editor()
+        value = self.observer.get_trackable_attribute(self.trackable_name, attribute_name)
+        x, y = self.canvas.coords(self.text_rows[attribute_name])
+
+        entry = tk.Entry(self.canvas)
+        entry.insert(0, repr(value))
+        entry.place(x=x, y=y, relwidth=1, height=self.TEXT_ROW_HEIGHT)
+        entry.bind("<Return>", lambda event: self.write_row_editor())
+        entry.bind("<Escape>", lambda event: self.close_row_editor())
+        entry.focus_set()
+        self._row_editor = (attribute_name, entry)
+
+    def write_row_editor(self):
+        """Writes the value typed into the row editor to the trackable, the editor stays open if it isn't a literal"""
+        attribute_name, entry = self._row_editor
+        try:
+            value = ast.literal_eval(entry.get())
+        except (ValueError, SyntaxError):
+            entry.bell()
+            return
+        self.close_row_editor()
+        # not silent, so other observers see the change. Only some types are notified, so the row is updated here
+        self.observer.set_trackable_attribute(self.trackable_name, attribute_name, value)
+        self.update_value(attribute_name, value)
 
-            self.gui_elements[attribute_name].update_widget_value(new_value)
+    def close_row_editor(self):
+        if self._row_editor is not None:
+            self._row_editor[1].destroy()
+            self._row_editor = None
+
+    def update_value(self, attribute_name, new_value):
+        gui_element = self.gui_elements.get(attribute_name)
+        if gui_element is not None:
+            if gui_element.interacting:
+                return  # don't fight the user over the value of a widget they are dragging
+            if gui_element.is_cached(new_value):
+                return
+
+            new_type = type(new_value)
+            if new_type is not gui_element.type and not (
+                    new_type in _NUMERIC_TYPES and gui_element.type in _NUMERIC_TYPES):
+                # the widgets only fit the type they were made for, e.g. when an attribute was previously None, so
+                # the element is rebuilt in place. Switching between int and float keeps the existing widgets
+                self.replace_element(attribute_name, new_value)
+                return
+
+            gui_element.update_widget_value(new_value)
+        elif attribute_name in self.text_rows:
+            if GuiElementFactory.supports(type(new_value)):
+                # the attribute changed to a type with an editable element, so it is no longer shown as text
+                self.remove_text_row(attribute_name)
+                self.add_element(attribute_name, new_value)
+            else:
+                self.canvas.itemconfigure(self.text_rows[attribute_name], text=f"{attribute_name} = {new_value}")
         else:
-            self.add_element(attribute_name)
+            self.add_element(attribute_name, new_value)
+
+    def refresh(self, attributes=None):
+        """Updates every element to the current value of its attribute, used when the frame is shown again. Elements
+        of attributes the trackable no longer has are removed"""
+        if attributes is None:
+            attributes = self.observer.get_trackable_attributes(self.trackable_name)
+        self.create_widgets(attributes)
+        for attribute_name, value in attributes.items():
+            self.update_value(attribute_name, value)
@@ -15,28 +15,32 @@ class Player:
         self.ddx = 0.0
         self.ddy = 0.0
 
-    def move(self):
-        self.x += self.dx
-        self.y += self.dy
-        if self.x < 0:
-            self.x = 0
-            self.dx = -self.dx
-        if self.x > WIDTH - 50:
-            self.x = WIDTH - 50
-            self.dx = -self.dx
-        if self.y < 0:
-            self.y = 0
-            self.dy = -self.dy
-        if self.y > HEIGHT - 50:
-            self.y = HEIGHT - 50
-            self.dy = -self.dy
-
-        if abs(self.dx) > 10:
-            self.dx = 10 if self.dx > 0 else -10
-
-        if abs(self.dy) > 10:
-            self.dy = 10 if self.dy > 0 else -10
-
+    def move(self, dx, dy):
+        # the physics is done on locals, so each attribute is written (and its observers notified) at most once
+        x = self.x + dx
+        y = self.y + dy
+        if x < 0:
+            x = 0
+            dx = -dx
+        if x > WIDTH - 50:
+            x = WIDTH - 50
+            dx = -dx
+        if y < 0:
+            y = 0
+            dy = -dy
+        if y > HEIGHT - 50:
+            y = HEIGHT - 50
+            dy = -dy
+
+        dx = max(-10, min(10, dx))
+        dy = max(-10, min(10, dy))
+
+        self.x = x
+        self.y = y
+        if dx != self.dx:
+            self.dx = dx
+        if dy != self.dy:
+            self.dy = dy
 
 
     def draw(self, screen):
@@ -44,18 +48,17 @@ class Player:
 
     def update(self):
         keys = pygame.key.get_pressed()
+        dx, dy = self.dx, self.dy
         if keys[pygame.K_LEFT]:
-            self.dx = -1
+            dx = -1
         if keys[pygame.K_RIGHT]:
-            self.dx = 1
+            dx = 1
         if keys[pygame.K_UP]:
-            self.dy = -1
+            dy = -1
         if keys[pygame.K_DOWN]:
-            self.dy = 1
+            dy = 1
 
-        self.dx += self.ddx
-        self.dy += self.ddy
-        self.move()
+        self.move(dx + self.ddx, dy + self.ddy)
 
 
 
@@ -68,7 +71,7 @@ def initialise_gui():
         app.pack()
         root.mainloop()
 
-    mediator = Mediator()
+    mediator = Mediator(using_queue=True)
     o = Observer(mediator)
     threading.Thread(target=run_gui, args=(o,)).start()
     return mediator
@@ -0,0 +1,199 @@
+import logging
+import threading
+import time
+import unittest
+
+from trackable import EVENT_TYPES, Mediator, Observer, Trackable
+
+
+class FastTrackable(Trackable):
+    UPDATE_INTERVAL_NS = 20_000_000
+
+
+class ObservedTest(unittest.TestCase):
+    """Records the attributes set on trackables added to self.mediator"""
+
+    def setUp(self):
+        self.events = []
+        self.batches = []
+        self.mediator = Mediator()
+        self.observer = Observer(self.mediator, self.record)
+
+    def record(self, trackable_name, key, value, event_type):
+        if event_type == EVENT_TYPES.SET_ATTRIBUTE:
+            self.events.append((key, value))
+        elif event_type == EVENT_TYPES.BATCH_SET:
+            self.batches.append(value)
+
+
+class UntimedTrackableTest(ObservedTest):
+    def test_notifies_every_write(self):
+        trackable = Trackable(None, "t")
+        self.mediator.add_trackable(trackable)
+        for i in range(5):
+            trackable.x = i
+        self.assertEqual(self.events, [("x", i) for i in range(5)])
+
+    def test_empty_and_private_keys(self):
+        trackable = Trackable(None, "t")
+        self.mediator.add_trackable(trackable)
+        setattr(trackable, "", 1)
+        trackable._private = 2
+        self.assertEqual(self.events, [("", 1)])
+
+    def test_batch_sends_filtered_copy(self):
+        trackable = Trackable(None, "t")
+        self.mediator.add_trackable(trackable)
+        attributes = {"_hidden": 2, "obj": [2], "name": "n2", "x": 1}
+        self.mediator.set_attributes("t", attributes)
+        attributes["x"] = 5
+        self.assertEqual(self.batches, [{"x": 1}])
+        self.assertEqual((trackable._hidden, trackable.obj, trackable.x), (2, [2], 1))
+
+
+class TimedTrackableTest(ObservedTest):
+    def wait_for_flush(self):
+        time.sleep(FastTrackable.UPDATE_INTERVAL_NS / 1e9 * 3)
+
+    def test_timed_sends_latest_held_value(self):
+        trackable = FastTrackable(None, "t", timed=True)
+        self.mediator.add_trackable(trackable)
+        for i in range(5):
+            trackable.x = i
+        self.assertEqual(self.events, [("x", 0)])
+
+        self.wait_for_flush()
+        self.assertEqual(self.events, [("x", 0), ("x", 4)])
+
+    def test_timed_attributes_keep_their_own_interval(self):
+        trackable = FastTrackable(None, "t", timed=True)
+        self.mediator.add_trackable(trackable)
+        times = {"x": [], "y": []}
+        Observer(self.mediator, lambda trackable_name, key, value, event_type: times[key].append(time.monotonic_ns())
+                 if event_type == EVENT_TYPES.SET_ATTRIBUTE else None)
+
+        trackable.x = 0
+        trackable.x = 1
+        time.sleep(FastTrackable.UPDATE_INTERVAL_NS / 1e9 / 2)
+        trackable.y = 0
+        trackable.y = 1
+        self.wait_for_flush()
+
+        self.assertEqual(self.events, [("x", 0), ("y", 0), ("x", 1), ("y", 1)])
+        for key_times in times.values():
+            self.assertGreaterEqual(key_times[1] - key_times[0], FastTrackable.UPDATE_INTERVAL_NS)
+
+    def test_timed_batch_holds_attributes_notified_too_soon(self):
+        trackable = FastTrackable(None, "t", timed=True)
+        self.mediator.add_trackable(trackable)
+        trackable.x = 0
+        trackable.set_attributes({"x": 1, "y": 2})
+        self.assertEqual(self.batches, [{"y": 2}])
+
+        self.wait_for_flush()
+        self.assertEqual(self.events, [("x", 0), ("x", 1)])
+
+    def test_timed_notifications_are_in_write_order(self):
+        trackable = FastTrackable(None, "t", timed=True)
+        self.mediator.add_trackable(trackable)
+
+        def write():
+            for i in range(2000):
+                trackable.x = i
+                if i % 100 == 0:
+                    time.sleep(0.005)
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        writer.join()
+        self.wait_for_flush()
+
+        values = [value for key, value in self.events]
+        self.assertEqual(values, sorted(values))
+        self.assertEqual(values[-1], 1999)
+
+
+class Enemy(Trackable):
+    def __init__(self, hp):
+        super().__init__(None, "enemy")
+        self.hp = hp
+
+
+class Player:
+    def __init__(self, x=0):
+        self.x = x
+
+    def reset(self):
+        self.__init__()
+
+
+class ConstructionTest(unittest.TestCase):
+    def test_subclass_takes_its_own_arguments(self):
+        self.assertEqual(Enemy(5).hp, 5)
+        self.assertEqual(Enemy(hp=5).hp, 5)
+        self.assertIs(type(Enemy(5)), Enemy)
+
+    def test_wrapped_object_shares_attributes(self):
+        player = Player(3)
+        trackable = Trackable(player, "player")
+        self.assertIsInstance(trackable, Player)
+        trackable.x = 4
+        self.assertEqual(player.x, 4)
+
+    def test_wrapped_init_keeps_mediators(self):
+        mediator = Mediator()
+        trackable = Trackable(Player(3), "player")
+        mediator.add_trackable(trackable)
+        trackable.reset()
+        self.assertEqual(trackable.x, 0)
+        self.assertEqual(list(trackable._mediators.values()), [mediator])
+
+
+class MediatorTest(unittest.TestCase):
+    def add(self, mediator, name):
+        trackable = Trackable(None, name)
+        mediator.add_trackable(trackable)
+        return trackable._name
+
+    def test_taken_names_have_their_number_incremented(self):
+        mediator = Mediator()
+        names = ["player", "player", "player2", "test1", "test1", "player5", "player"]
+        self.assertEqual([self.add(mediator, name) for name in names],
+                         ["player", "player2", "player3", "test1", "test2", "player5", "player4"])
+
+
+class DispatcherTest(unittest.TestCase):
+    def test_failing_observer_does_not_stop_dispatcher(self):
+        mediator = Mediator(using_thread=True)
+        trackable = Trackable(None, "t")
+        mediator.add_trackable(trackable)
+        events = []
+
+        def notify(trackable_name, key, value, event_type):
+            if value == 1:
+                raise ValueError(value)
+            events.append((key, value))
+
+        Observer(mediator, notify)
+        with self.assertLogs("trackable", logging.ERROR):
+            trackable.x = 1
+            trackable.x = 2
+            mediator.stop_dispatcher()
+        self.assertIn(("x", 2), events)
+
+    def test_stop_dispatcher(self):
+        mediator = Mediator(using_thread=True)
+        dispatcher = mediator._dispatcher
+        mediator.stop_dispatcher()
+        self.assertFalse(dispatcher.is_alive())
+
+        trackable = Trackable(None, "t")
+        mediator.add_trackable(trackable)
+        events = []
+        Observer(mediator, lambda trackable_name, key, value, event_type: events.append((key, value)))
+        trackable.x = 1
+        self.assertEqual(events, [("x", 1)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,28 +1,57 @@
 from __future__ import annotations
 
+import ast
+import collections
+import heapq
 import inspect
 import logging
 import queue
-import re
 import textwrap
 import threading
 import time
 import tkinter
-from typing import Dict, List, Callable
+import types
+from types import MappingProxyType
+from typing import Dict, List, Callable, Mapping, Tuple
+
+try:
+    from fastrlock.rlock import FastRLock as RLock  # a faster reentrant lock, when it is installed
+except ImportError:
+    from threading import RLock
 
 global_trackable_declared = False
 
+# code compiled by track_vars_custom, keyed by the decorated function's location, the trackable and the variables
+_compiled_functions: Dict[tuple, types.CodeType] = {}
+
 
 class EVENT_TYPES:
-    SET_ATTRIBUTE = "set_attribute"
-    METHOD_CALL = "method_call"
-    WITHIN_THRESHOLD = "within_threshold"
-    TRACKABLE_ADDED = "trackable_added"
-    TRACKABLE_REMOVED = "trackable_removed"
+    # consecutive integers, so observers can index a table of handlers by event type
+    SET_ATTRIBUTE = 0
+    BATCH_SET = 1
+    METHOD_CALL = 2
+    WITHIN_THRESHOLD = 3
+    TRACKABLE_ADDED = 4
+    TRACKABLE_REMOVED = 5
+
+    COUNT = 6
 
 
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
+
+# attributes that are never reported to mediators, besides private ones starting with an underscore
+_SKIP_KEYS = frozenset({"name"})
+# exact types of the attribute values reported to mediators, checked by a set lookup instead of isinstance
+_PRIMITIVE_TYPES = frozenset({int, float, str, bool, type(None)})
+
+
+def _is_notified(key, value):
+    """Whether a write of value to the attribute key is notified to mediators, the rules of Trackable.__setattr__"""
+    return not key.startswith("_") and key not in _SKIP_KEYS and type(value) in _PRIMITIVE_TYPES
+
+
+# bound once so setting an attribute doesn't look up __setattr__ on object each time
+_object_setattr = object.__setattr__
 
 
 # todo remove observer class, just use mediator, with collection of callbacks
@@ -51,79 +80,181 @@ logger.setLevel(logging.DEBUG)
 
 
 class Trackable:
+    # the bookkeeping attributes are slots, while tracked attributes still live in __dict__. __weakref__ keeps
+    # Trackable weakly referenceable, like the dynamic classes merged with ordinary classes
+    __slots__ = ("_trackable_attributes", "_trackable_methods", "_mediators", "_mediator_notifies", "_lock", "_name",
+                 "_last_update", "_is_timed", "_timing_lock", "_pending_values", "_flush_due", "__dict__",
+                 "__weakref__")
+
     dynamic_class_cache = {}
 
     UPDATES_PER_SECOND = 5
     UPDATE_INTERVAL = 1 / UPDATES_PER_SECOND
-
-    def __init__(self, obj=None, name: str = None):
-        logger.debug(f"Trackable.__init__({obj}, {name})")
-        if obj is not None:
-            original_class = obj.__class__
-            merged_class = None
-            if original_class not in self.dynamic_class_cache:
-                merged_class = self.dynamic_class_cache[original_class] = type(
-                    f"DynamicClass_{original_class.__name__}",
-                    (original_class, Trackable), {})
-
-            # Inherit special methods, attributes and methods from original class of obj
-            self.__class__ = merged_class or self.dynamic_class_cache[original_class]
-            self.__dict__.update(obj.__dict__)
-            logger.debug(f"Trackable.__init__ {self.__class__} {self.__dict__})")
+    UPDATE_INTERVAL_NS = 1_000_000_000 // UPDATES_PER_SECOND
+
+    def __new__(cls, *args, **kwargs):
+        # only Trackable(obj, ...) wraps an object, subclasses take whatever arguments their own __init__ does
+        obj = args[0] if args else kwargs.get("obj")
+        if cls is not Trackable or obj is None:
+            return object.__new__(cls)
+        # Inherit special methods, attributes and methods from original class of obj. The instance is created as the
+        # merged class and shares obj's __dict__, rather than reassigning __class__ and copying the attributes
+        merged_class = _make_dynamic_class(obj.__class__)
+        instance = object.__new__(merged_class)
+        instance.__dict__ = obj.__dict__
+        return instance
+
+    def __init__(self, obj=None, name: str = None, timed=False):
+        """When timed, each attribute notifies mediators at most UPDATES_PER_SECOND times a second, and the latest
+        value of writes made in between is sent once the interval ends"""
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Trackable.__init__(%s, %s) %s %s", obj, name, self.__class__, self.__dict__)
 
         self._trackable_attributes = {}
-        self._trackable_methods = {}
+        self._trackable_methods: Dict[str, int] = collections.Counter()  # how many times each method was called
 
-        self._mediators = []
+        # keyed by id for constant time removal, _mediator_notifies holds their bound notify methods and is rebuilt
+        # on every change, so notifying doesn't look up the method on each mediator
+        self._mediators: Dict[int, Mediator] = {}
+        self._mediator_notifies: Tuple[Callable, ...] = ()
         self._lock = threading.Lock()
 
         self._name = name or self.__class__.__name__
-        self._last_update: Dict[str, float] = {}
+        self._last_update: Dict[str, int] = {}  # monotonic_ns of the last notified write to each attribute
 
-        self._is_timed = False  # temporary fix to allow immediate consecutive updates (will be unneccessary when using queue)
+        self._is_timed = timed
+        # latest values of timed attributes written too soon after their last notification, sent by _flush_pending.
+        # the lock orders those notifications with the ones made by writes, and is reentrant so an observer can write
+        # back to the trackable
+        self._timing_lock = threading.RLock() if timed else None
+        self._pending_values: Dict[str, object] = {}
+        self._flush_due = None  # monotonic_ns the next flush is scheduled for, None when none is
 
     def __setattr__(self, key, value, silent=False):
-        super.__setattr__(self, key, value)
-        if silent or key.startswith("_") or key == "name":
+        _object_setattr(self, key, value)
+        # the rules of _is_notified, inlined as this runs on every write
+        if silent or key.startswith("_") or key in _SKIP_KEYS:
             return
 
-        if time.time() - self._last_update.get(key, 0) < self.UPDATE_INTERVAL and self._is_timed:
+        if type(value) not in _PRIMITIVE_TYPES:
             return
 
-        if not (isinstance(value, (int, float, str, bool)) or value is None):
+        # the clock is only read for timed trackables, untimed ones notify every write
+        if self._is_timed:
+            self._notify_timed(key, value)
             return
 
-        logger.debug(f"{self} setting {key} = {value}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("%s setting %s = %s", self, key, value)
         self.notify_mediators(key, value, EVENT_TYPES.SET_ATTRIBUTE)
-        self._last_update[key] = time.time()
 
     def __repr__(self):
         return f"{self.__class__.__name__}({self._name})"
 
+    def _notify_timed(self, key, value):
+        """Notify mediators of a write to a timed attribute, or hold it until the attribute's interval ends"""
+        with self._timing_lock:
+            if self._hold_if_too_soon(key, value, time.monotonic_ns()):
+                return
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("%s setting %s = %s", self, key, value)
+            self.notify_mediators(key, value, EVENT_TYPES.SET_ATTRIBUTE)
+
+    def _hold_if_too_soon(self, key, value, now):
+        """Holds value if key was notified less than UPDATE_INTERVAL_NS ago, otherwise records that key is notified
+        now. Must be called with the timing lock held"""
+        last = self._last_update.get(key)
+        if last is not None and now - last < self.UPDATE_INTERVAL_NS:
+            # the value is held rather than dropped, so mediators still get the latest value once the interval ends
+            self._pending_values[key] = value
+            self._schedule_flush(last + self.UPDATE_INTERVAL_NS, now)
+            return True
+        self._last_update[key] = now
+        self._pending_values.pop(key, None)  # superseded by this value
+        return False
+
+    def _schedule_flush(self, due, now):
+        """Makes sure a flush runs by due, a monotonic_ns time. Must be called with the timing lock held"""
+        # a flush scheduled earlier than needed reschedules itself for the held values that are not due yet
+        if self._flush_due is None or due < self._flush_due:
+            self._flush_due = due
+            _scheduler.call_later(due - now, self._flush_pending)
+
+    def _flush_pending(self):
+        """Notify mediators of the latest value of each held attribute whose interval has ended, and schedule a flush
+        for the rest"""
+        with self._timing_lock:
+            self._flush_due = None
+            pending = self._pending_values
+            last_update = self._last_update
+            interval = self.UPDATE_INTERVAL_NS
+            now = time.monotonic_ns()
+            for key in list(pending):
+                if now - last_update[key] < interval:
+                    continue
+                value = pending.pop(key)
+                last_update[key] = now
+                self.notify_mediators(key, value, EVENT_TYPES.SET_ATTRIBUTE)
+
+            if pending:
+                self._schedule_flush(min(last_update[key] for key in pending) + interval, now)
+
     def get_lock(self):
         return self._lock
 
     def add_mediator(self, mediator):
-        self._mediators.append(mediator)
+        # each mediator adding the trackable holds only its own lock, so the trackable's guards its mediators
+        with self._lock:
+            self._mediators[id(mediator)] = mediator
+            self._mediator_notifies = tuple(mediator.notify for mediator in self._mediators.values())
 
         mediator.notify(self._name, self._name, [self.get_trackable_attributes(), self.get_trackable_methods()],
                         EVENT_TYPES.TRACKABLE_ADDED)
 
     def remove_mediator(self, mediator):
-        self._mediators.remove(mediator)
+        with self._lock:
+            del self._mediators[id(mediator)]
+            self._mediator_notifies = tuple(mediator.notify for mediator in self._mediators.values())
 
-    def notify_mediators(self, key, value, type):
-        for mediator in self._mediators:
-            logger.debug(f"notifying {mediator} of {self._name}.{key} = {value}")
-            mediator.notify(self._name, key, value, type)
+    def notify_mediators(self, key, value, event_type):
+        notifies = self._mediator_notifies
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("notifying %s of %s.%s = %s", list(self._mediators.values()), self._name, key, value)
+
+        if len(notifies) == 1:
+            notifies[0](self._name, key, value, event_type)  # the common case, without setting up a loop
+            return
+        for notify in notifies:
+            notify(self._name, key, value, event_type)
 
     def get_trackable_attributes(self):
         # returns self.__dict__ except for private attributes
-        return {key: value for key, value in self.__dict__.items() if not key.startswith("_")}
+        # the dict is copied first, as iterating it directly fails if another thread adds an attribute meanwhile
+        return {key: value for key, value in self.__dict__.copy().items() if not key.startswith("_")}
 
     def get_trackable_methods(self):
         return self._trackable_methods
 
+    def set_attributes(self, attributes: Dict[str, object], silent=False):
+        """Set several attributes, notifying mediators once with all of them instead of once per attribute. Only the
+        attributes __setattr__ would notify are sent, in a copy of attributes"""
+        for key, value in attributes.items():
+            _object_setattr(self, key, value)  # a silent __setattr__, without the extra call
+        if silent:
+            return
+
+        notified = {key: value for key, value in attributes.items() if _is_notified(key, value)}
+        if not self._is_timed:
+            if notified:
+                self.notify_mediators(self._name, notified, EVENT_TYPES.BATCH_SET)
+            return
+
+        with self._timing_lock:
+            now = time.monotonic_ns()
+            notified = {key: value for key, value in notified.items() if not self._hold_if_too_soon(key, value, now)}
+            if notified:
+                self.notify_mediators(self._name, notified, EVENT_TYPES.BATCH_SET)
+
     def invoke(self, method_name, *args, **kwargs):
         if hasattr(self, method_name):
             method = getattr(self, method_name)
@@ -137,15 +268,14 @@ class Trackable:
 
     @staticmethod
     def notify_method_call(func):
+        name = func.__name__
 
         def wrapper(self, *args, silent=False, **kwargs):
-            name = func.__name__
-            if name not in self._trackable_methods:
-                self._trackable_methods[name] = 0
             self._trackable_methods[name] += 1
 
             # print(f"notifying mediators of function call: {name}(args={args}, kwargs={kwargs})")
-            logger.debug(f"notifying mediators of function call: {name}(args={args}, kwargs={kwargs})")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("notifying mediators of function call: %s(args=%s, kwargs=%s)", name, args, kwargs)
 
             if not silent:
                 self.notify_mediators(name, args + tuple(kwargs), EVENT_TYPES.METHOD_CALL)
@@ -155,18 +285,101 @@ class Trackable:
         return wrapper
 
 
+class _Scheduler:
+    """Calls functions after a delay, all on one daemon thread that is started when first needed"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._calls: List[tuple] = []  # heap of (due time in monotonic_ns, call number, function)
+        self._call_count = 0  # breaks ties between calls due at the same time, as functions can't be compared
+        self._thread = None
+
+    def call_later(self, delay_ns, function):
+        with self._condition:
+            self._call_count += 1
+            heapq.heappush(self._calls, (time.monotonic_ns() + delay_ns, self._call_count, function))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trackable-scheduler", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def _run(self):
+        calls = self._calls
+        while True:
+            with self._condition:
+                while True:
+                    wait_ns = calls[0][0] - time.monotonic_ns() if calls else None
+                    if wait_ns is not None and wait_ns <= 0:
+                        break
+                    self._condition.wait(None if wait_ns is None else wait_ns / 1e9)
+                _, _, function = heapq.heappop(calls)
+            try:
+                function()
+            except Exception:
+                logger.exception("scheduled call to %s failed", function)
+
+
+_STOP_DISPATCHER = object()  # put on a mediator's event queue to stop its dispatcher thread
+_scheduler = _Scheduler()  # flushes the held values of every timed trackable
+
+
+def _make_dynamic_class(original_class):
+    """Returns the class merging original_class with Trackable, created once per original class"""
+    merged_class = Trackable.dynamic_class_cache.get(original_class)
+    if merged_class is None:
+        def __init__(self, *args, **kwargs):
+            # the call made by Trackable(obj, name) sets up the trackable, as the original class's __init__ would
+            # otherwise run on the already built object. Later calls, e.g. a method of the original class calling
+            # self.__init__(), run the original class's __init__ and leave the mediators and lock alone
+            if not hasattr(self, "_mediators"):
+                Trackable.__init__(self, *args, **kwargs)
+            else:
+                original_class.__init__(self, *args, **kwargs)
+
+        # setdefault is atomic, so if two threads create the class at once they both end up with the same one
+        merged_class = Trackable.dynamic_class_cache.setdefault(
+            original_class, type(f"DynamicClass_{original_class.__name__}", (original_class, Trackable),
+                                 {"__init__": __init__}))
+    return merged_class
+
+
 global_tracker = Trackable(None, "global_tracker")  # global tracker for variables that are not part of a class
 
 
 class Mediator:
-    def __init__(self, trackables: List[Trackable] = None, observers: List[Observer] = None):
-        self._trackables: Dict[str, Trackable] = {}
-        self._observers: List[Observer] = []
-        self._lock = threading.RLock()
+    __slots__ = ("_trackables", "_trackables_view", "_observers", "_observers_view", "_lock", "_name_counters",
+                 "_using_queue", "_pending", "_pending_lock", "_event_count", "_using_thread", "_events", "_dispatcher")
 
-        self._queue = queue.Queue()
-        self._using_queue = True  # temporary, to compare performance of queue vs lock
+    # only the latest event of these types matters, so a pending one is replaced rather than queued behind
+    COALESCED_EVENTS = (EVENT_TYPES.SET_ATTRIBUTE,)
 
+    def __init__(self, trackables: List[Trackable] = None, observers: List[Observer] = None, using_queue=False,
+                 using_thread=False):
+        self._trackables: Dict[str, Trackable] = {}
+        # read-only copy of _trackables, replaced whenever a trackable is added or removed so it can be read unlocked
+        self._trackables_view: Mapping[str, Trackable] = MappingProxyType({})
+        # keyed by id for constant time removal, _observers_view is a tuple of them rebuilt on every change
+        self._observers: Dict[int, Observer] = {}
+        self._observers_view: Tuple[Observer, ...] = ()
+        self._lock = RLock()
+        self._name_counters: Dict[str, int] = {}  # the last number added to each name to make it unique
+
+        # when using the queue, events are held until drain is called by the thread observers should run on
+        self._using_queue = using_queue
+        self._pending: Dict[object, tuple] = {}
+        self._pending_lock = threading.Lock()
+        self._event_count = 0  # unique keys for events that are never coalesced
+
+        # when using a thread, notifying only puts the event on a queue, and observers are notified by the dispatcher
+        self._using_thread = using_thread
+        self._events = None
+        self._dispatcher = None
+        if using_thread:
+            self._events = queue.SimpleQueue()
+            # the thread references the mediator until stop_dispatcher is called, so the mediator isn't collected
+            self._dispatcher = threading.Thread(target=self._dispatch, name=f"{self.__class__.__name__}-dispatcher",
+                                                daemon=True)
+            self._dispatcher.start()
 
         if global_trackable_declared:
             self.add_trackable(global_tracker)
@@ -176,95 +389,192 @@ class Mediator:
 
     def add_trackable(self, trackable: Trackable):
         with self._lock:
+            # a taken name has its trailing number incremented, e.g. player becomes player2 and player2 becomes
+            # player3. The search starts after the last number given to the same base name
             new_name = trackable._name
-            while new_name in self._trackables:
-                if re.search(r"(\d+)$", new_name):
-                    new_name = re.sub(r"(\d+)$", lambda m: str(int(m.group(1)) + 1), new_name)
-                else:
-                    new_name += "2"
+            if new_name in self._trackables:
+                base_name = new_name.rstrip("0123456789")
+                number = max(int(new_name[len(base_name):] or 1), self._name_counters.get(base_name, 0)) + 1
+                while f"{base_name}{number}" in self._trackables:
+                    number += 1
+                self._name_counters[base_name] = number
+                new_name = f"{base_name}{number}"
 
             trackable._name = new_name
 
             self._trackables[new_name] = trackable
+            self._trackables_view = MappingProxyType(self._trackables.copy())
             trackable.add_mediator(self)
 
-        # queues:
-        # self._queue.put((self.add_trackable, trackable))
-
-
     def remove_trackable(self, trackable: Trackable):
         with self._lock:
             self._trackables.pop(trackable._name)
+            self._trackables_view = MappingProxyType(self._trackables.copy())
             trackable.remove_mediator(self)
 
     def add_observer(self, observer):
         with self._lock:
-            self._observers.append(observer)
+            self._observers[id(observer)] = observer
+            self._observers_view = tuple(self._observers.values())
 
     def remove_observer(self, observer):
         with self._lock:
-            self._observers.remove(observer)
+            del self._observers[id(observer)]
+            self._observers_view = tuple(self._observers.values())
 
     def notify(self, trackable_name, key, value, type):
-        """Notify observers of a change to a trackable."""
-        logger.debug(f"notifying observers of {trackable_name}.{key} = {value}, await lock")
-        with self._lock:
-            logger.debug(f"notifying observers of {trackable_name}.{key} = {value}, got lock")
-            for observer in self._observers:
-                observer.notify(trackable_name, key, value, type)
+        """Notify observers of a change to a trackable, or queue the notification until drain is called."""
+        if self._using_thread:
+            self._events.put_nowait((trackable_name, key, value, type))
+            return
+        if not self._using_queue:
+            self._notify_observers(trackable_name, key, value, type)
+            return
+
+        with self._pending_lock:
+            if type in self.COALESCED_EVENTS:
+                event_key = (trackable_name, key)
+                self._pending.pop(event_key, None)  # the replacement goes after any events queued since
+            else:
+                self._event_count += 1
+                event_key = self._event_count
+            self._pending[event_key] = (trackable_name, key, value, type)
+
+    def drain(self):
+        """Notify observers of every queued event, keeping only the latest value of each attribute."""
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        for event in pending.values():
+            self._notify_observers(*event)
+
+    def _dispatch(self):
+        """Notify observers of events as they are put on the queue, run by the dispatcher thread"""
+        events = self._events
+        while True:
+            event = events.get()
+            if event is _STOP_DISPATCHER:
+                return
+            try:
+                self._notify_observers(*event)
+            except Exception:
+                # the dispatcher has to outlive a failing observer, or no other event would ever be delivered
+                logger.exception("notifying observers of %s failed", event)
+
+    def stop_dispatcher(self):
+        """Stops the dispatcher thread once it has delivered the events already queued. Observers are notified
+        directly from then on"""
+        if self._dispatcher is None:
+            return
+        self._events.put_nowait(_STOP_DISPATCHER)
+        if self._dispatcher is not threading.current_thread():
+            self._dispatcher.join()
+        self._using_thread = False
+        self._dispatcher = None
+
+    def _notify_observers(self, trackable_name, key, value, type):
+        # observers are notified from the current snapshot without the lock, so a slow observer doesn't block others
+        # and an observer can add or remove observers without deadlocking
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("notifying observers of %s.%s = %s", trackable_name, key, value)
+        for observer in self._observers_view:
+            observer.notify(trackable_name, key, value, type)
 
     def set_attribute(self, trackable_name, key, value, silent=False):
         """Set an attribute on a trackable and notify observers."""
         trackable = self._trackables[trackable_name]
-        logger.debug(f"setting {trackable_name}.{key} = {value}, await lock")
-        with self._lock and trackable.get_lock():
-            logger.debug(f"setting {trackable_name}.{key} = {value}, got lock")
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug("setting %s.%s = %s, await lock", trackable_name, key, value)
+        # only the trackable is locked while writing, the mediator lock is taken once, by the notification
+        with trackable.get_lock():
+            if debug:
+                logger.debug("setting %s.%s = %s, got lock", trackable_name, key, value)
 
             trackable.__setattr__(key, value, silent=silent)
 
+    def set_attributes(self, trackable_name, attributes, silent=False):
+        """Set several attributes on a trackable and notify observers with a single event."""
+        trackable = self._trackables[trackable_name]
+        with trackable.get_lock():
+            trackable.set_attributes(attributes, silent=silent)
+
     def invoke_method(self, trackable_name, method_name, args=None, kwargs=None):
         """Invoke a method on a trackable and notify observers."""
         args = args or []
         kwargs = kwargs or {}
         trackable = self._trackables[trackable_name]
-        with self._lock and trackable.get_lock():
+        with trackable.get_lock():
             # print(f"invoking {trackable_name}.{method_name}({args}, {kwargs})")
-            logger.debug(f"\tinvoking {trackable_name}.{method_name}({args}, {kwargs})")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("\tinvoking %s.%s(%s, %s)", trackable_name, method_name, args, kwargs)
             trackable.invoke(method_name, *args, **kwargs)
 
+    # the getters below read _trackables_view, so they never wait for the lock
+
+    def get_attribute(self, trackable_name, key):
+        """Get a single attribute of a trackable, without building the attributes of every trackable."""
+        return self._trackables_view[trackable_name].__dict__[key]
+
+    def get_attribute_type(self, trackable_name, key):
+        """Get the type of a single attribute of a trackable."""
+        return type(self._trackables_view[trackable_name].__dict__[key])
+
+    def get_attributes(self, trackable_name):
+        """Get all attributes of a single trackable."""
+        return self._trackables_view[trackable_name].get_trackable_attributes()
+
     def get_all_attributes(self):
         """Get all attributes of all trackables."""
-        with self._lock:
-            return {trackable_name: trackable.get_trackable_attributes() for trackable_name, trackable in
-                    self._trackables.items()}
+        return {trackable_name: trackable.get_trackable_attributes() for trackable_name, trackable in
+                self._trackables_view.items()}
 
     def get_all_methods(self):
         """Get all methods of all trackables."""
-        with self._lock:
-            return {trackable_name: trackable.get_trackable_methods() for trackable_name, trackable in
-                    self._trackables.items()}
+        return {trackable_name: trackable.get_trackable_methods() for trackable_name, trackable in
+                self._trackables_view.items()}
+
+
+def _noop(*args, **kwargs):
+    pass
 
 
 class Observer:
+    __slots__ = ("mediator", "_notify_callback")
+
     def __init__(self, mediator: Mediator, notify_callback: Callable = None):
         self.mediator = mediator
+        self.notify_callback = notify_callback  # set before registering, as the mediator may notify straight away
         self.mediator.add_observer(self)
-        self.notify_callback = notify_callback
+
+    @property
+    def notify_callback(self):
+        return self._notify_callback
+
+    @notify_callback.setter
+    def notify_callback(self, callback):
+        # an unset callback is stored as _noop, so notify can call it without checking
+        self._notify_callback = callback or _noop
 
     def set_notify_callback(self, callback):
         self.notify_callback = callback
 
     def notify(self, trackable_name, key, value, type):
         # print(f"observer: {trackable_name}.{key} = {value} ({type})")
-        logger.debug(f"\t\tobserver invoking callback: {trackable_name}.{key} = {value} ({type})")
-        if self.notify_callback:
-            self.notify_callback(trackable_name, key, value, type)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("\t\tobserver invoking callback: %s.%s = %s (%s)", trackable_name, key, value, type)
+        self._notify_callback(trackable_name, key, value, type)
 
     def set_trackable_attribute(self, trackable_name, key, value, silent=False):
         self.mediator.set_attribute(trackable_name, key, value, silent)
 
+    def set_trackable_attributes(self, trackable_name, attributes, silent=False):
+        self.mediator.set_attributes(trackable_name, attributes, silent)
+
     def get_trackable_attribute(self, trackable_name, key):
-        return self.mediator.get_all_attributes()[trackable_name][key]
+        return self.mediator.get_attribute(trackable_name, key)
+
+    def get_trackable_attribute_type(self, trackable_name, key):
+        return self.mediator.get_attribute_type(trackable_name, key)
 
     def invoke_method(self, trackable_name, method_name, args=None, kwargs=None):
         self.mediator.invoke_method(trackable_name, method_name, args, kwargs)
@@ -272,43 +582,50 @@ class Observer:
     def get_trackable_attributes(self, trackable_name=None):
         if trackable_name is None:
             return self.mediator.get_all_attributes()
-        return self.mediator.get_all_attributes()[trackable_name]
+        return self.mediator.get_attributes(trackable_name)
 
 
-def track_vars_custom(trackable: Trackable, *to_track):
-    """Decorator to track variables in a function.
-        Adds the variables to the trackable object and macros the variable to refer to the trackable's attribute
-         instead.
-        WARNING: This will break code that has string literals used for logic that contain the variable names."""
+class TrackedVariableTransformer(ast.NodeTransformer):
+    """Rewrites every reference to the tracked variables into an attribute of the trackable.
+    Only variable names are rewritten, so string literals, comments and attributes with the same name are untouched"""
+
+    def __init__(self, trackable_name, to_track):
+        self.trackable_name = trackable_name
+        self.to_track = frozenset(to_track)
 
-    def replace_vars(source):
-        """Replace all references within the source with another"""
-        for var in to_track:
-            source = re.sub(rf"(?<!['\"])(\b{var}\b)(?!['\"])", f"{trackable._name}.{var}", source)
+    def visit_Name(self, node):
+        if node.id not in self.to_track:
+            return node
+        trackable = ast.Name(id=self.trackable_name, ctx=ast.Load())
+        return ast.copy_location(ast.Attribute(value=trackable, attr=node.id, ctx=node.ctx), node)
 
-            # regex to match any occurrences of the variable name that are not within quotes
-            # not a trivial problem (impossible using regex?), so just replace all occurrences of the variable name
-            # if they're not directly next to quotes:
-            # source = re.sub(rf"(?<!['\"])({var})(?!['\"])", f"{trackable.name}.{var}", source)
-            # todo use a macro library to replace the variables instead of regex, or create own macro function
-            # use ast to parse the source, and get the indices of all string literals, ignoring any occurrences that are
 
-        return source
+def track_vars_custom(trackable: Trackable, *to_track):
+    """Decorator to track variables in a function.
+        Adds the variables to the trackable object and macros the variable to refer to the trackable's attribute
+         instead."""
 
     def decorator(func):
         # todo check each to_track to see if its a primitive, or object and either add it to the trackable or
         #  create a new trackable for it
         trackable.declare_variables(*to_track)
 
+        cache_key = (func.__code__.co_filename, func.__code__.co_firstlineno, trackable._name, to_track)
+        wrapper = _compiled_functions.get(cache_key)
+        if wrapper is None:
+            source, first_line = inspect.getsourcelines(func)
+            tree = ast.parse(textwrap.dedent("".join(source)))
+            del tree.body[0].decorator_list[0]  # exclude this decorator (avoid recursion)
 
-        source = inspect.getsourcelines(func)[0][1:]  # exclude the decorator line (avoid recursion)
-        source = textwrap.dedent("".join(source))
+            tree = TrackedVariableTransformer(trackable._name, to_track).visit(tree)
+            ast.increment_lineno(tree, first_line - 1)  # so tracebacks point at the original source
+            ast.fix_missing_locations(tree)
 
-        source = replace_vars(source)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("track_vars rewrote %s:\n%s", func.__name__, ast.unparse(tree))
 
-        print(source)
+            wrapper = _compiled_functions[cache_key] = compile(tree, func.__code__.co_filename, "exec")
 
-        wrapper = compile(source, f"{func.__name__}.py", "exec")
         namespace = {}
         exec(wrapper, func.__globals__, namespace)
 
@@ -320,14 +637,14 @@ def track_vars_custom(trackable: Trackable, *to_track):
 def track_vars(*to_track):
     """Decorator to track variables in a function.
         Adds the variables to the global_tracker object and macros the variable to refer to the global_tracker's
-         attribute instead.
-        WARNING: This will break code that has string literals used for logic that contain the variable names."""
+         attribute instead."""
     global global_trackable_declared
     global_trackable_declared = True
     return track_vars_custom(global_tracker, *to_track)
 
 
 def start_logging():
+    logger.setLevel(logging.DEBUG)
     console_handler = logging.StreamHandler()
     console_handler.setLevel(logging.DEBUG)
     console_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))